@@ -0,0 +1,723 @@
+"""
+Shared building blocks for the pano download scripts.
+
+download_images.py (local disk) and download_images_r2.py (Cloudflare R2) only
+differ in where finished images go; puzzle loading, filename generation, direct
+downloads, the local HTTP server and the Playwright screenshot path live here.
+"""
+
+import asyncio
+import functools
+import io
+import logging
+import os
+import socket
+import threading
+from pathlib import Path
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+import aiohttp
+import numpy as np
+from playwright.async_api import async_playwright
+from PIL import Image
+
+try:
+    # orjson parses large puzzle files several times faster than the stdlib
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+try:
+    # ijson (yajl2_c backend when available) streams tiles out of large puzzle files
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    # simplejpeg (libjpeg-turbo) encodes thumbnails much faster than Pillow
+    import simplejpeg
+except ImportError:
+    simplejpeg = None
+
+try:
+    # PyTurboJPEG is the other libjpeg-turbo binding; it also needs the shared library at runtime
+    from turbojpeg import TurboJPEG, TJPF_RGB, TJSAMP_420
+    turbo_jpeg = TurboJPEG()
+except (ImportError, OSError, RuntimeError):
+    turbo_jpeg = None
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+SCREENSHOT_WIDTH = 2400
+SCREENSHOT_HEIGHT = 1600
+BROWSER_POOL_RECYCLE_AFTER = int(os.getenv("BROWSER_POOL_RECYCLE_AFTER", "100"))  # Pages per context before it is replaced
+# Chromium flags for headless screenshotting: no background work, extensions or first-run UI
+CHROMIUM_ARGS = [
+    '--no-sandbox',
+    '--disable-dev-shm-usage',
+    '--disable-background-networking',
+    '--disable-background-timer-throttling',
+    '--disable-renderer-backgrounding',
+    '--disable-backgrounding-occluded-windows',
+    '--disable-sync',
+    '--disable-extensions',
+    '--disable-translate',
+    '--disable-features=Translate,BackForwardCache,AcceptCHFrame',
+    '--mute-audio',
+    '--hide-scrollbars',
+    '--no-first-run',
+    '--no-default-browser-check',
+]
+
+WRITE_BUFFER_SIZE = 1 << 20  # Large write buffer so image saves turn into a handful of write syscalls
+_PROJECT_ROOT = str(Path(__file__).parent.parent)  # Served by the local HTTP server
+PUZZLES_DIR = Path(_PROJECT_ROOT) / "ui" / "public" / "puzzles"
+HTTP_HOST = "127.0.0.1"  # Loopback address the local HTTP server binds to
+# Host pages are loaded from; Maps checks the API key's referrer restrictions against this origin
+PAGE_HOST = "localhost"
+DIRECT_DOWNLOAD_BASE_URL = "https://geonections.com/pano/img/"
+DIRECT_DOWNLOAD_CONCURRENCY = 32  # In-flight direct downloads (plain HTTP, so they can fan out wide)
+DIRECT_DOWNLOAD_RETRIES = 2  # Extra attempts after a transient gateway error, before falling back to the browser
+DIRECT_DOWNLOAD_BACKOFF = 0.2  # Seconds before the first retry, doubling each time
+RETRY_STATUSES = frozenset({502, 503, 504})
+# Resource types the pano screenshot never needs (images, scripts, xhr/fetch and documents are kept)
+BLOCKED_RESOURCE_TYPES = ("font", "stylesheet", "media", "websocket", "other")
+# Analytics, ads and UI chrome requests from Maps that the screenshot doesn't need
+BLOCKED_URL_FRAGMENTS = ("doubleclick", "google-analytics", "gstatic.com/gb/", "fonts.googleapis")
+PANO_TILES_TIMEOUT = 3000  # ms to wait for the network to go quiet after the pano metadata has loaded
+
+
+_ZERO = "0"
+
+
+def round_number(num, decimals=2):
+    """Round to 2 decimal places, strip trailing zeros and dot"""
+    # Puzzle JSON gives ints and floats, so only cast anything else
+    if type(num) is int:
+        return str(num)
+    if type(num) is not float:
+        num = float(num)
+    if num == 0:
+        return _ZERO
+    rounded = round(num, decimals)
+    rounded_int = int(rounded)
+    if rounded == rounded_int:
+        return str(rounded_int)
+    return str(rounded)
+
+
+def create_http_session():
+    """Create the shared aiohttp session used for direct downloads."""
+    # Keep idle connections to geonections.com alive between tiles so each
+    # download skips the TCP+TLS handshake
+    connector = aiohttp.TCPConnector(
+        limit=64,
+        limit_per_host=DIRECT_DOWNLOAD_CONCURRENCY,
+        keepalive_timeout=30,
+        ttl_dns_cache=300,
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=10, connect=3),
+        headers={
+            "User-Agent": "geonections-pano-downloader",
+            "Accept": "image/jpeg",
+        },
+    )
+
+
+def create_thumbnail(image):
+    """Downscale an image to a 400x300 thumbnail and return it as JPEG bytes."""
+    # If the image is a JPEG that hasn't been decoded yet, let libjpeg decode it
+    # at a reduced DCT scale (still >= 400x300) so LANCZOS runs on far fewer pixels
+    image.draft('RGB', (400, 300))
+    thumb_image = image.resize((400, 300), Image.Resampling.LANCZOS)
+    try:
+        if simplejpeg is not None:
+            return simplejpeg.encode_jpeg(np.asarray(thumb_image.convert('RGB')), quality=85, colorspace='RGB', colorsubsampling='420')
+        if turbo_jpeg is not None:
+            return turbo_jpeg.encode(np.asarray(thumb_image.convert('RGB')), quality=85, pixel_format=TJPF_RGB, jpeg_subsample=TJSAMP_420)
+        thumb_buffer = io.BytesIO()
+        thumb_image.save(thumb_buffer, "JPEG", quality=85)
+        return thumb_buffer.getvalue()
+    finally:
+        thumb_image.close()
+
+
+async def stream_to_file(response, output_path, chunk_size=64 * 1024):
+    """Write a response body to disk chunk by chunk, removing the partial file on failure."""
+    size = 0
+    try:
+        with open(output_path, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+            async for chunk in response.content.iter_chunked(chunk_size):
+                f.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        Path(output_path).unlink(missing_ok=True)
+        raise
+    return size
+
+
+async def _fetch_direct(http_session, url, output_path=None):
+    """Fetch one direct-download URL, returning (image bytes or output_path, None) or (None, failing HTTP status)."""
+    # Probe with HEAD first so missing tiles don't pull down a 404 page body
+    async with http_session.head(url, timeout=aiohttp.ClientTimeout(total=5, connect=3), allow_redirects=True) as head:
+        content_type = head.headers.get('content-type', '')
+        if head.status != 200:
+            logger.debug("  ✗ HTTP %s", head.status)
+            return None, head.status
+        if 'image' not in content_type:
+            logger.debug("  ✗ Not an image: %s", content_type)
+            return None, None
+    
+    async with http_session.get(url) as response:
+        if response.status != 200:
+            logger.debug("  ✗ HTTP %s", response.status)
+            return None, response.status
+        # Check if it's actually an image
+        content_type = response.headers.get('content-type', '')
+        if 'image' not in content_type:
+            logger.debug("  ✗ Not an image: %s", content_type)
+            return None, None
+        if output_path is not None:
+            size = await stream_to_file(response, output_path)
+            logger.debug("  ✓ SUCCESS: %s streamed image to disk (size: %d bytes)", url, size)
+            return output_path, None
+        content = await response.read()
+        logger.debug("  ✓ SUCCESS: %s returned image (size: %d bytes)", url, len(content))
+        return content, None
+
+
+async def try_direct_download(http_session, filename, output_path=None):
+    """Try to directly download a tile's image from geonections.com/pano/img/
+
+    If output_path is given, the image is streamed to that file in chunks and
+    the path is returned instead of the image bytes. Transient gateway errors
+    are retried with backoff, since the browser fallback is far more expensive.
+    """
+    # The site stores images under the same name we use, so the cached tile filename is the URL
+    url = f"{DIRECT_DOWNLOAD_BASE_URL}{filename}"
+    for attempt in range(DIRECT_DOWNLOAD_RETRIES + 1):
+        if attempt:
+            await asyncio.sleep(DIRECT_DOWNLOAD_BACKOFF * 2 ** (attempt - 1))
+        try:
+            if attempt:
+                logger.debug("  Trying: %s (retry %d)", url, attempt)
+            else:
+                logger.debug("  Trying: %s", url)
+            result, status = await _fetch_direct(http_session, url, output_path)
+        except Exception as e:
+            logger.debug("  ✗ Error: %s", e)
+            break
+        if result is not None:
+            return url, result
+        if status not in RETRY_STATUSES:
+            break
+    
+    logger.debug("  ✗ No direct download available for %s", filename)
+    return None, None
+
+
+def create_new_filename(tile):
+    """Create new filename based on spec: {panoid}~d{YYYY-MM}~h{heading}~p{pitch}~z{zoom}.jpg"""
+    # Get panoId from either top level or extra object
+    extra = tile.get('extra') or {}
+    pano_id = tile.get('panoId') or extra.get('panoId')
+    if not pano_id:
+        raise ValueError("No panoId found in tile data")
+    
+    # Try to get date from extra.panoDate, fallback to current date
+    date = extra.get('panoDate', '2024-01')
+    if not date:
+        logger.warning(f"WARNING: No panoDate found for {pano_id}, using 2024-01")
+        date = '2024-01'
+    
+    # Get actual values from the tile data
+    heading = round_number(tile.get('heading', 0))
+    pitch = round_number(tile.get('pitch', 0))
+    zoom = int(tile.get('zoom', 0))
+    
+    return f"{pano_id}~d{date}~h{heading}~p{pitch}~z{zoom}.jpg"
+
+
+def get_tile_filename(tile):
+    """Return the tile's filename, computing it on first use and caching it on the tile as _filename."""
+    filename = tile.get('_filename')
+    if filename is None:
+        filename = tile['_filename'] = create_new_filename(tile)
+    return filename
+
+
+_TILE_KEYS = ("customCoordinates", "tiles", "data")  # Keys holding the tile list, in priority order
+STREAM_PARSE_MIN_BYTES = 1 << 20  # Puzzle files at least this big are stream-parsed with ijson
+
+
+def _extract_tiles(data):
+    """Extract the tile list from any supported puzzle JSON structure (None if unknown)."""
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict):
+        return next((data[key] for key in _TILE_KEYS if key in data), None)
+    return None
+
+
+def _stream_tiles(json_path):
+    """Stream a puzzle file in one pass, building only the tile list candidates (None if not found)."""
+    # Values of the tile keys (or the whole document if it is a bare list), keyed on their ijson prefix
+    found = {}
+    builder = builder_prefix = None
+    with open(json_path, "rb") as f:
+        for prefix, event, value in ijson.parse(f, use_float=True):
+            if builder is not None:
+                builder.event(event, value)
+                if prefix == builder_prefix and event in ("end_array", "end_map"):
+                    found[builder_prefix] = builder.value
+                    builder = None
+            elif prefix in _TILE_KEYS or (prefix == "" and event == "start_array"):
+                if event in ("start_array", "start_map"):
+                    builder = ijson.ObjectBuilder()
+                    builder_prefix = prefix
+                    builder.event(event, value)
+                else:
+                    found[prefix] = value
+    if "" in found:
+        return found[""]
+    return _extract_tiles(found)
+
+
+@functools.lru_cache(maxsize=None)
+def _load_tiles(json_path_str, mtime):
+    """Parse a puzzle JSON file once per run; keyed on mtime so edits are picked up."""
+    json_path = Path(json_path_str)
+    if ijson is not None and json_path.stat().st_size >= STREAM_PARSE_MIN_BYTES:
+        return _stream_tiles(json_path)
+    return _extract_tiles(json_loads(json_path.read_bytes()))
+
+
+def load_puzzle_tiles(json_file):
+    """Return the tiles for a puzzle JSON file, using the parse cache."""
+    return _load_tiles(str(json_file), json_file.stat().st_mtime)
+
+
+def build_panoid_index(json_files):
+    """Map every panoId in the given puzzle files to its tile (first occurrence wins)."""
+    index = {}
+    for json_file in json_files:
+        try:
+            for t in load_puzzle_tiles(json_file) or []:
+                for tile_pano_id in (t.get('panoId'), (t.get('extra') or {}).get('panoId')):
+                    if tile_pano_id:
+                        index.setdefault(tile_pano_id, t)
+        except Exception as e:
+            logger.error(f"Error reading {json_file}: {e}")
+    return index
+
+
+def find_free_port():
+    """Find a free port to use for the HTTP server."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('', 0))
+        s.listen(1)
+        port = s.getsockname()[1]
+    return port
+
+
+class HTTPHandler(SimpleHTTPRequestHandler):
+    """Custom HTTP handler to serve files from the project root."""
+    
+    # Keep connections alive so each page's subresources reuse one socket
+    protocol_version = "HTTP/1.1"
+    # Pages every tile loads, served from memory after the first read
+    CACHED_PATHS = ("/pano/download.html",)
+    _cache = {}
+    
+    def __init__(self, *args, **kwargs):
+        # Serve from the project root, computed once at import time
+        super().__init__(*args, directory=_PROJECT_ROOT, **kwargs)
+    
+    def do_GET(self):
+        """Serve cached pages from memory, everything else from disk."""
+        path = self.path.split('?', 1)[0]
+        if path not in self.CACHED_PATHS:
+            return super().do_GET()
+        entry = self._cache.get(path)
+        if entry is None:
+            file_path = self.translate_path(path)
+            try:
+                entry = self._cache[path] = (Path(file_path).read_bytes(), self.guess_type(file_path))
+            except OSError:
+                return super().do_GET()
+        body, content_type = entry
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        """Suppress default logging to reduce noise."""
+        pass
+
+
+def start_http_server(port):
+    """Start a threaded HTTP server in a separate thread so concurrent pages load in parallel."""
+    server = ThreadingHTTPServer((HTTP_HOST, port), HTTPHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, thread
+
+
+async def block_unneeded_resources(route):
+    """Abort browser requests that don't contribute to the panorama."""
+    request = route.request
+    if request.resource_type in BLOCKED_RESOURCE_TYPES or any(fragment in request.url for fragment in BLOCKED_URL_FRAGMENTS):
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+class BrowserPool:
+    """Shares a single browser process across a bounded pool of reusable browser contexts."""
+    
+    def __init__(self, max_contexts):
+        self.max_contexts = max_contexts
+        self.semaphore = asyncio.Semaphore(max_contexts)
+        self.idle_contexts = []
+        self.uses = {}
+        self.browser = None
+        self.playwright = None
+        
+    async def initialize(self):
+        """Launch the shared browser and open the pool's contexts up front."""
+        self.playwright = await async_playwright().start()
+        self.browser = await self.playwright.chromium.launch(headless=True, args=CHROMIUM_ARGS)
+        # Contexts are cheap next to the browser itself, so create them all concurrently now
+        self.idle_contexts = list(await asyncio.gather(
+            *(self._new_context() for _ in range(self.max_contexts))
+        ))
+    
+    async def _new_context(self):
+        """Open a configured context in the shared browser."""
+        context = await self.browser.new_context(
+            viewport={
+                "width": SCREENSHOT_WIDTH,
+                "height": SCREENSHOT_HEIGHT
+            },
+            bypass_csp=True,
+        )
+        # Configure once per context so every page opened in it inherits the settings
+        context.set_default_navigation_timeout(30000)
+        await context.route("**/*", block_unneeded_resources)
+        self.uses[context] = 0
+        return context
+    
+    async def acquire_context(self):
+        """Wait for a free slot and hand out an idle context, creating one if none is idle."""
+        await self.semaphore.acquire()
+        try:
+            if self.idle_contexts:
+                return self.idle_contexts.pop()
+            return await self._new_context()
+        except Exception:
+            self.semaphore.release()
+            raise
+    
+    async def release_context(self, context, page=None):
+        """Close the page and return its context to the pool, recycling contexts after heavy use."""
+        try:
+            self.uses[context] += 1
+            if page is not None:
+                await page.close()
+            if self.uses[context] < BROWSER_POOL_RECYCLE_AFTER:
+                self.idle_contexts.append(context)
+                return
+            # Contexts accumulate native memory, so replace them periodically
+            del self.uses[context]
+            await context.close()
+        finally:
+            self.semaphore.release()
+    
+    async def close_all(self):
+        """Close all pooled contexts and the shared browser."""
+        for context in self.idle_contexts:
+            await context.close()
+        self.idle_contexts.clear()
+        if self.browser:
+            await self.browser.close()
+        if self.playwright:
+            await self.playwright.stop()
+
+
+async def capture_pano_screenshot(browser_pool, tile, api_key, http_port):
+    """Screenshot a tile's panorama through download.html, returning (JPEG bytes, thumbnail bytes) or None."""
+    context = await browser_pool.acquire_context()
+    page = None
+    full_image = None
+    
+    try:
+        # Create a new page (the context already has the full resolution viewport)
+        page = await context.new_page()
+        
+        # Build URL for our download.html with the tile data
+        base_url = f"http://{PAGE_HOST}:{http_port}/pano/download.html"
+        # Must have panoId - no fallback to lat/lng
+        extra = tile.get("extra") or {}
+        pano_id = tile.get("panoId") or extra.get("panoId")
+        if not pano_id:
+            logger.error(f"ERROR: Tile missing panoId in both main field and extra.panoId")
+            raise ValueError("Tile must have panoId - no fallback to lat/lng allowed")
+        
+        # Every value is numeric or a URL-safe panoId, so the query string needs no encoding
+        url = (
+            f"{base_url}?key={api_key}&heading={tile.get('heading', 0)}"
+            f"&pitch={tile.get('pitch', 0)}&zoom={tile.get('zoom', 0)}&pano={pano_id}"
+        )
+        
+        # Add console logging to capture any warnings or errors
+        console_messages = []
+        page.on("console", lambda msg: console_messages.append(f"[{msg.type.upper()}] {msg.text}"))
+        
+        # Navigate to our download.html page; only wait for the response, the pano flag below is the real signal
+        try:
+            await page.goto(url, wait_until="commit", timeout=15000)
+        except Exception as e:
+            logger.error(f"Navigation failed for {pano_id}: {e}")
+            return None
+        
+        # Wait for the panorama to actually load by checking the flag set by download.html
+        try:
+            await page.wait_for_function("window.panoLoaded === true", timeout=30000)
+            # panoLoaded only means the pano metadata resolved and the image tiles are fetched after
+            # that; Street View has no tiles-loaded event, so give the network a short window to go
+            # quiet. Maps often keeps a request open, so running out of time here is expected
+            try:
+                await page.wait_for_load_state("networkidle", timeout=PANO_TILES_TIMEOUT)
+            except Exception as e:
+                logger.debug("Network still busy after pano load for %s: %s", pano_id, e)
+            # Make sure the canvas is laid out, then let one more frame paint the tiles that just arrived
+            await page.wait_for_function("document.querySelector('#pano canvas')?.width > 0", timeout=5000)
+            await page.evaluate("new Promise(resolve => requestAnimationFrame(() => requestAnimationFrame(resolve)))")
+        except Exception as e:
+            logger.warning(f"⚠ Warning: Panorama may not have loaded properly for {pano_id}: {e}")
+            # Still continue, but black screens are rejected below
+        
+        # Take screenshot of the pano element (full resolution)
+        pano_element = await page.query_selector("#pano")
+        if not pano_element:
+            logger.error(f"✗ Failed to find pano element for {pano_id}")
+            return None
+        
+        # Capture straight to JPEG so the bytes can be stored as-is without a re-encode
+        screenshot_bytes = await pano_element.screenshot(type="jpeg", quality=90)
+        
+        # The brightness check and thumbnail only need ~600x400, so let libjpeg decode at reduced scale
+        full_image = Image.open(io.BytesIO(screenshot_bytes))
+        full_image.draft('RGB', (400, 300))
+        full_image.load()
+        
+        # Check if the screenshot is mostly black
+        # Approximate average brightness from the RGB channels of every 4th pixel
+        # of the reduced-scale decode, skipping a grayscale conversion
+        avg_brightness = float(np.asarray(full_image)[::4, ::4, :3].mean())
+        
+        if avg_brightness < 10:  # Very dark image
+            # Don't store it: existing images are skipped on later runs, so a bad frame would never be replaced
+            logger.error(f"✗ Screenshot appears to be black/dark for {pano_id} (avg brightness: {avg_brightness:.1f}), not saving it")
+            return None
+        
+        # Create thumbnail (downscaled)
+        return screenshot_bytes, create_thumbnail(full_image)
+        
+    except Exception as e:
+        logger.error(f"✗ Error downloading {tile.get('panoId', 'unknown')}: {e}")
+        return None
+    finally:
+        # Free the decoded pixels now rather than whenever the image is collected
+        if full_image is not None:
+            full_image.close()
+        await browser_pool.release_context(context, page)
+
+
+# Images are handed to a store, which is what distinguishes the two scripts. A store has
+#   stream_path(filename) -> a local path direct downloads can stream straight to, or None
+#   async save(filename, data) -> persists one image's JPEG bytes
+
+
+async def _save_images(store, full_filename, full_data, thumb_filename, thumb_data):
+    """Save a full image and its thumbnail concurrently (full_data is None if it was streamed already)."""
+    saves = [store.save(thumb_filename, thumb_data)]
+    if full_data is not None:
+        saves.append(store.save(full_filename, full_data))
+    await asyncio.gather(*saves)
+
+
+async def download_pano_image_direct(tile, store, http_session):
+    """Download a single pano image directly from geonections.com if possible."""
+    # Generate filename using the new naming format
+    try:
+        full_filename = get_tile_filename(tile)
+        thumb_filename = full_filename.replace('.jpg', '~thumb.jpg')
+    except Exception as e:
+        logger.error(f"ERROR: Failed to create filename for tile: {e}")
+        return None
+    
+    # Try direct download, streaming the image straight to disk when the store is local
+    output_path = store.stream_path(full_filename)
+    url, result = await try_direct_download(http_session, full_filename, output_path=output_path)
+    if not url:
+        return None
+    
+    try:
+        # Create thumbnail from the saved file or the downloaded bytes
+        full_data = None if output_path is not None else result
+        with Image.open(output_path if output_path is not None else io.BytesIO(result)) as full_image:
+            thumb_data = create_thumbnail(full_image)
+        await _save_images(store, full_filename, full_data, thumb_filename, thumb_data)
+    except Exception as e:
+        logger.error(f"✗ Error saving direct download {full_filename}: {e}")
+        return None
+    
+    logger.info(f"✓ Direct download: {full_filename} + {thumb_filename}")
+    return [full_filename, thumb_filename]
+
+
+async def download_pano_image(browser_pool, tile, api_key, store, http_port, http_session, skip_direct_download=False):
+    """Download a single pano image, trying direct download first, then fallback to download.html."""
+    # First try direct download from geonections.com (unless disabled)
+    if not skip_direct_download:
+        logger.debug("Trying direct download first...")
+        direct_result = await download_pano_image_direct(tile, store, http_session)
+        if direct_result:
+            return direct_result
+        logger.debug("Direct download failed, falling back to browser method...")
+    else:
+        logger.debug("Skipping direct download, using browser method...")
+    
+    # Generate filenames using the new naming format
+    try:
+        full_filename = get_tile_filename(tile)
+        thumb_filename = full_filename.replace('.jpg', '~thumb.jpg')
+    except Exception as e:
+        logger.error(f"ERROR: Failed to create filename for tile: {e}")
+        return None
+    
+    # Fallback to browser method
+    screenshot = await capture_pano_screenshot(browser_pool, tile, api_key, http_port)
+    if screenshot is None:
+        return None
+    full_data, thumb_data = screenshot
+    
+    try:
+        await _save_images(store, full_filename, full_data, thumb_filename, thumb_data)
+    except Exception as e:
+        logger.error(f"✗ Error saving {full_filename}: {e}")
+        return None
+    
+    logger.info(f"✓ Downloaded: {full_filename} + {thumb_filename}")
+    return [full_filename, thumb_filename]
+
+
+async def download_tiles(tiles, browser_pool, api_key, store, http_port, http_session, skip_direct_download=False):
+    """Download the given tiles into the store, returning the filenames saved.
+
+    Direct downloads all run concurrently first; only their misses go to the browser pool.
+    """
+    downloaded = []
+    browser_tiles = tiles
+    
+    if not skip_direct_download:
+        semaphore = asyncio.Semaphore(DIRECT_DOWNLOAD_CONCURRENCY)
+        
+        async def bounded(tile):
+            async with semaphore:
+                return await download_pano_image_direct(tile, store, http_session)
+        
+        results = await asyncio.gather(*[bounded(tile) for tile in tiles], return_exceptions=True)
+        browser_tiles = []
+        for tile, filenames in zip(tiles, results):
+            if isinstance(filenames, Exception):
+                logger.error(f"✗ Direct download crashed, falling back to browser: {filenames}")
+                browser_tiles.append(tile)
+            elif filenames:
+                downloaded.extend(filenames)
+            else:
+                browser_tiles.append(tile)
+        logger.info(f"Direct downloads: {len(tiles) - len(browser_tiles)}/{len(tiles)} succeeded")
+    
+    if browser_tiles:
+        # Queue every browser download at once; the browser pool caps how many run concurrently
+        logger.info(f"Downloading {len(browser_tiles)} tiles with the browser...")
+        results = await asyncio.gather(
+            *[download_pano_image(browser_pool, tile, api_key, store, http_port, http_session, skip_direct_download=True) for tile in browser_tiles],
+            return_exceptions=True,
+        )
+        for filenames in results:
+            if isinstance(filenames, Exception):
+                logger.error(f"✗ Browser download crashed: {filenames}")
+            elif filenames:
+                downloaded.extend(filenames)
+    
+    return downloaded
+
+
+async def check_http_server(port):
+    """Check the local HTTP server is accepting connections without blocking the event loop."""
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(HTTP_HOST, port), timeout=1.0)
+        writer.close()
+        await writer.wait_closed()
+        print("✓ HTTP server is accepting connections")
+    except (OSError, asyncio.TimeoutError) as e:
+        print(f"⚠ HTTP server test failed: {e}")
+
+
+async def process_single_pano(pano_id, store, api_key=None, skip_direct_download=False):
+    """Process a single pano ID for testing."""
+    print(f"Processing single pano: {pano_id}")
+    
+    # Look up the actual tile data from JSON files
+    tile = build_panoid_index(list(PUZZLES_DIR.glob("*.json"))).get(pano_id)
+    
+    if not tile:
+        print(f"ERROR: Pano ID {pano_id} not found in any JSON files")
+        return
+    
+    print(f"Found tile data: {tile}")
+    
+    async with create_http_session() as http_session:
+        # Try direct download first (unless disabled)
+        if not skip_direct_download:
+            print("Trying direct download first...")
+            direct_result = await download_pano_image_direct(tile, store, http_session)
+            if direct_result:
+                print(f"Successfully saved via direct method: {direct_result}")
+                return
+        else:
+            print("Skipping direct download, using browser method...")
+        
+        # If direct download fails and we have an API key, try browser method
+        if api_key:
+            print("Direct download failed, trying browser method...")
+            
+            # Find a free port and start HTTP server
+            port = find_free_port()
+            server, server_thread = start_http_server(port)
+            print(f"Started HTTP server on port {port}")
+            
+            # Initialize browser pool
+            browser_pool = BrowserPool(1)
+            await browser_pool.initialize()
+            
+            try:
+                # Download the image using browser method (direct download was already attempted above)
+                filename = await download_pano_image(browser_pool, tile, api_key, store, port, http_session, skip_direct_download=True)
+                if filename:
+                    print(f"Successfully saved via browser method: {filename}")
+                else:
+                    print("Failed to download image with both methods")
+            finally:
+                await browser_pool.close_all()
+                server.shutdown()
+        else:
+            print("Direct download failed and no API key provided for fallback")
@@ -11,354 +11,95 @@ Uses the new naming format: {panoid}~d{YYYY-MM}~h{heading}~p{pitch}~z{zoom}.jpg
 """
 
 import asyncio
-import json
+import logging
 import os
+import re
 import sys
 import time
-import socket
-import threading
-import requests
 from pathlib import Path
-from urllib.parse import urlencode
-from http.server import HTTPServer, SimpleHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor
 
-from playwright.async_api import async_playwright
 from PIL import Image
 
-# Configuration
-SCREENSHOT_WIDTH = 2400
-SCREENSHOT_HEIGHT = 1600
-MAX_CONCURRENT_BROWSERS = 2  # Reduced to prevent resource exhaustion
-
+from _core import (
+    BrowserPool,
+    check_http_server,
+    create_http_session,
+    create_thumbnail,
+    download_tiles,
+    find_free_port,
+    get_tile_filename,
+    load_puzzle_tiles,
+    process_single_pano,
+    start_http_server,
+)
+
+logger = logging.getLogger(__name__)
 
-def round_number(num, decimals=2):
-    """Round to 2 decimal places, strip trailing zeros and dot"""
-    rounded = round(float(num), decimals)
-    if rounded == int(rounded):
-        return str(int(rounded))
-    return str(rounded)
+# Configuration
+MAX_CONCURRENT_CONTEXTS = 8  # Browser contexts sharing one Chromium process
+# Full images and thumbnails in the {panoid}~d{date}~h{heading}~p{pitch}~z{zoom}.jpg naming format
+_NEW_FMT = re.compile(r"~d[^~]+~h[^~]+~p[^~]+~z\d+(?:~thumb)?\.jpg$")
 
 
-def try_direct_download(pano_id, heading=0, pitch=0, zoom=0, date="2024-01"):
-    """Try to directly download images from geonections.com/pano/img/"""
-    print(f"Trying direct download for panoId: {pano_id}")
+class LocalImageStore:
+    """Saves images into a local directory."""
     
-    # Try different URL patterns that might work
-    test_urls = [
-        f"https://geonections.com/pano/img/{pano_id}~d{date}~h{heading}~p{pitch}~z{zoom}.jpg",
-    ]
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
     
-    for url in test_urls:
-        try:
-            print(f"  Trying: {url}")
-            response = requests.get(url, timeout=10)
-            if response.status_code == 200:
-                # Check if it's actually an image
-                content_type = response.headers.get('content-type', '')
-                if 'image' in content_type:
-                    print(f"  ✓ SUCCESS: {url} returned image (size: {len(response.content)} bytes)")
-                    return url, response.content
-                else:
-                    print(f"  ✗ Not an image: {content_type}")
-            else:
-                print(f"  ✗ HTTP {response.status_code}")
-        except Exception as e:
-            print(f"  ✗ Error: {e}")
+    def stream_path(self, filename):
+        """Direct downloads stream straight into the output directory."""
+        return self.output_dir / filename
     
-    print(f"  ✗ No direct download available for {pano_id}")
-    return None, None
-
+    async def save(self, filename, data):
+        """Write one image's bytes to the output directory."""
+        (self.output_dir / filename).write_bytes(data)
 
-async def download_pano_image_direct(tile, output_dir):
-    """Download a single pano image directly from geonections.com if possible."""
-    # Get panoId from either top level or extra object
-    pano_id = tile.get('panoId') or tile.get('extra', {}).get('panoId')
-    if not pano_id:
-        print(f"ERROR: No panoId found in tile data")
-        return None
-    
-    # Get actual values from the tile data
-    heading = round_number(tile.get('heading', 0))
-    pitch = round_number(tile.get('pitch', 0))
-    zoom = int(tile.get('zoom', 0))
-    
-    # Get date from extra.panoDate, fallback to current date
-    date = tile.get('extra', {}).get('panoDate', '2024-01')
-    if not date:
-        print(f"WARNING: No panoDate found for {pano_id}, using 2024-01")
-        date = '2024-01'
-    
-    # Try direct download
-    url, content = try_direct_download(pano_id, heading, pitch, zoom, date)
-    
-    if url and content:
-        try:
-            # Generate filename using the new naming format
-            base_filename = create_new_filename(tile)
-            full_filename = base_filename
-            thumb_filename = base_filename.replace('.jpg', '~thumb.jpg')
-            
-            # Save the image
-            with open(output_dir / full_filename, 'wb') as f:
-                f.write(content)
-            
-            # Create thumbnail
-            full_image = Image.open(output_dir / full_filename)
-            thumb_image = full_image.resize((400, 300), Image.Resampling.LANCZOS)
-            thumb_image.save(output_dir / thumb_filename, "JPEG", quality=85)
-            
-            print(f"✓ Direct download: {full_filename} + {thumb_filename}")
-            return [full_filename, thumb_filename]
-            
-        except Exception as e:
-            print(f"✗ Error saving direct download for {pano_id}: {e}")
-            return None
-    
-    return None
-
-
-def create_new_filename(tile):
-    """Create new filename based on spec: {panoid}~d{YYYY-MM}~h{heading}~p{pitch}~z{zoom}.jpg"""
-    # Get panoId from either top level or extra object
-    pano_id = tile.get('panoId') or tile.get('extra', {}).get('panoId')
-    if not pano_id:
-        raise ValueError("No panoId found in tile data")
-    
-    # Try to get date from extra.panoDate, fallback to current date
-    date = tile.get('extra', {}).get('panoDate', '2024-01')
-    if not date:
-        print(f"WARNING: No panoDate found for {pano_id}, using 2024-01")
-        date = '2024-01'
-    
-    # Get actual values from the tile data
-    heading = round_number(tile.get('heading', 0))
-    pitch = round_number(tile.get('pitch', 0))
-    zoom = int(tile.get('zoom', 0))
-    
-    
-    return f"{pano_id}~d{date}~h{heading}~p{pitch}~z{zoom}.jpg"
-
-
-def find_free_port():
-    """Find a free port to use for the HTTP server."""
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.bind(('', 0))
-        s.listen(1)
-        port = s.getsockname()[1]
-    return port
-
-
-class HTTPHandler(SimpleHTTPRequestHandler):
-    """Custom HTTP handler to serve files from the project root."""
-    
-    def __init__(self, *args, **kwargs):
-        # Set the directory to serve from (project root)
-        project_root = Path(__file__).parent.parent
-        super().__init__(*args, directory=str(project_root), **kwargs)
-    
-    def log_message(self, format, *args):
-        """Suppress default logging to reduce noise."""
-        pass
 
+def _load_tiles_from_path(json_file):
+    """Load a puzzle file's tiles, returning any error instead of raising it."""
+    try:
+        return load_puzzle_tiles(json_file) or []
+    except Exception as e:
+        return e
 
-def start_http_server(port):
-    """Start an HTTP server in a separate thread."""
-    server = HTTPServer(('localhost', port), HTTPHandler)
-    thread = threading.Thread(target=server.serve_forever, daemon=True)
-    thread.start()
-    return server, thread
 
+def load_all_puzzle_tiles(json_files):
+    """Read and parse puzzle files on a thread pool, returning (json_file, tiles or error) pairs in order."""
+    with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4)) as executor:
+        return list(zip(json_files, executor.map(_load_tiles_from_path, json_files)))
 
-class BrowserPool:
-    """Manages a pool of browser instances for concurrent processing."""
-    
-    def __init__(self, max_browsers):
-        self.max_browsers = max_browsers
-        self.browsers = []
-        self.available = asyncio.Queue()
-        self.playwright = None
-        
-    async def initialize(self):
-        """Initialize the browser pool."""
-        self.playwright = await async_playwright().start()
-        
-        for _ in range(self.max_browsers):
-            browser = await self.playwright.chromium.launch(
-                headless=True,
-                args=[
-                    '--no-sandbox', 
-                    '--disable-dev-shm-usage',
-                    '--disable-gpu',
-                    '--disable-web-security',
-                    '--disable-features=VizDisplayCompositor',
-                    '--memory-pressure-off',
-                    '--max_old_space_size=4096'
-                ]
-            )
-            self.browsers.append(browser)
-            await self.available.put(browser)
-    
-    async def get_browser(self):
-        """Get an available browser from the pool."""
-        return await self.available.get()
-    
-    async def return_browser(self, browser):
-        """Return a browser to the pool."""
-        await self.available.put(browser)
-    
-    async def close_all(self):
-        """Close all browsers in the pool."""
-        for browser in self.browsers:
-            await browser.close()
-        if self.playwright:
-            await self.playwright.stop()
 
-
-async def download_pano_image(browser_pool, tile, api_key, output_dir, http_port, skip_direct_download=False):
-    """Download a single pano image, trying direct download first, then fallback to download.html."""
-    # First try direct download from geonections.com (unless disabled)
-    if not skip_direct_download:
-        print(f"Trying direct download first...")
-        direct_result = await download_pano_image_direct(tile, output_dir)
-        if direct_result:
-            return direct_result
-        print(f"Direct download failed, falling back to browser method...")
-    else:
-        print(f"Skipping direct download, using browser method...")
-    
-    # Fallback to browser method
-    browser = await browser_pool.get_browser()
-    
+def list_existing_files(directory, suffix=""):
+    """Return the names of files in a directory from a single scandir (empty if it doesn't exist)."""
     try:
-        # Create a new page
-        page = await browser.new_page()
-        
-        # Set viewport size for full resolution
-        await page.set_viewport_size({
-            "width": SCREENSHOT_WIDTH,
-            "height": SCREENSHOT_HEIGHT
-        })
-        
-        # Build URL for our download.html with the tile data
-        base_url = f"http://localhost:{http_port}/pano/download.html"
-        params = {
-            "key": api_key,
-            "heading": tile.get("heading", 0),
-            "pitch": tile.get("pitch", 0),
-            "zoom": tile.get("zoom", 0),
-        }
-        
-        # Must have panoId - no fallback to lat/lng
-        pano_id = None
-        if "panoId" in tile and tile["panoId"] is not None and tile["panoId"]:
-            pano_id = tile["panoId"]
-        elif "extra" in tile and isinstance(tile["extra"], dict) and "panoId" in tile["extra"] and tile["extra"]["panoId"] is not None and tile["extra"]["panoId"]:
-            pano_id = tile["extra"]["panoId"]
-        
-        if not pano_id:
-            print(f"ERROR: Tile missing panoId in both main field and extra.panoId")
-            raise ValueError("Tile must have panoId - no fallback to lat/lng allowed")
-        
-        params["pano"] = pano_id
-        
-        url = f"{base_url}?{urlencode(params)}"
-        
-        # Add console logging to capture any warnings or errors
-        console_messages = []
-        page.on("console", lambda msg: console_messages.append(f"[{msg.type.upper()}] {msg.text}"))
-        
-        # Navigate to our download.html page
-        try:
-            await page.goto(url, wait_until="networkidle", timeout=60000)
-        except Exception as e:
-            print(f"Navigation failed for {pano_id}: {e}")
-            return None
-        
-        # Wait for the pano to load (check for the pano element to be visible)
-        await page.wait_for_selector("#pano", timeout=30000)
-        
-        # Wait for the panorama to actually load by checking the flag set by download.html
-        try:
-            await page.wait_for_function("window.panoLoaded === true", timeout=30000)
-            # Give it a moment to fully render
-            await asyncio.sleep(1)
-        except Exception as e:
-            print(f"⚠ Warning: Panorama may not have loaded properly for {pano_id}: {e}")
-            # Still continue, but we'll detect black screens later
-        
-        # Generate filenames using the new naming format
-        try:
-            base_filename = create_new_filename(tile)
-            full_filename = base_filename
-            thumb_filename = base_filename.replace('.jpg', '~thumb.jpg')
-        except Exception as e:
-            print(f"ERROR: Failed to create filename for tile: {e}")
-            return None
-        
-        # Take screenshot of the pano element (full resolution)
-        pano_element = await page.query_selector("#pano")
-        if pano_element:
-            # Save full resolution image
-            await pano_element.screenshot(path=output_dir / full_filename)
-            
-            # Check if the screenshot is mostly black
-            full_image = Image.open(output_dir / full_filename)
-            # Convert to grayscale and check average brightness
-            gray_image = full_image.convert('L')
-            avg_brightness = sum(gray_image.getdata()) / len(gray_image.getdata())
-            
-            if avg_brightness < 10:  # Very dark image
-                print(f"⚠ Warning: Screenshot appears to be black/dark for {pano_id} (avg brightness: {avg_brightness:.1f})")
-            
-            # Create thumbnail (downscaled)
-            thumb_image = full_image.resize((400, 300), Image.Resampling.LANCZOS)
-            thumb_image.save(output_dir / thumb_filename, "JPEG", quality=85)
-            
-            print(f"✓ Downloaded: {full_filename} + {thumb_filename}")
-            return [full_filename, thumb_filename]
-        else:
-            print(f"✗ Failed to find pano element for {pano_id}")
-            return None
-        
-    except Exception as e:
-        print(f"✗ Error downloading {tile.get('panoId', 'unknown')}: {e}")
-        return None
-    finally:
-        await page.close()
-        await browser_pool.return_browser(browser)
+        with os.scandir(directory) as entries:
+            return {entry.name for entry in entries if entry.is_file() and entry.name.endswith(suffix)}
+    except FileNotFoundError:
+        return set()
 
 
-async def process_json_file_async(json_file, browser_pool, api_key, http_port, skip_direct_download=False):
+async def process_json_file_async(json_file, browser_pool, api_key, http_port, http_session, skip_direct_download=False):
     """Process a single JSON file and download all images."""
-    print(f"Processing {json_file.name}...")
+    logger.info(f"Processing {json_file.name}...")
     
     try:
-        with open(json_file, 'r') as f:
-            data = json.load(f)
-        
-        # Extract tiles from the JSON structure
-        tiles = []
-        if isinstance(data, list):
-            tiles = data
-        elif isinstance(data, dict) and "customCoordinates" in data:
-            tiles = data["customCoordinates"]
-        elif isinstance(data, dict) and "tiles" in data:
-            tiles = data["tiles"]
-        elif isinstance(data, dict) and "data" in data:
-            tiles = data["data"]
-        else:
-            print(f"Unknown JSON structure in {json_file.name}")
+        tiles = load_puzzle_tiles(json_file)
+        if tiles is None:
+            logger.warning(f"Unknown JSON structure in {json_file.name}")
             return []
     
         if not tiles:
-            print(f"No tiles found in {json_file.name}")
+            logger.info(f"No tiles found in {json_file.name}")
             return []
     
-        print(f"Found {len(tiles)} tiles in {json_file.name}")
+        logger.info(f"Found {len(tiles)} tiles in {json_file.name}")
         
         # Create output directory
         output_dir = Path(__file__).parent / "img"
         output_dir.mkdir(exist_ok=True)
+        existing_files = list_existing_files(output_dir)
         
         # Check which images are needed
         needed_tiles = []
@@ -366,28 +107,24 @@ async def process_json_file_async(json_file, browser_pool, api_key, http_port, s
         
         for tile in tiles:
             # Get panoId from main field or extra field
-            pano_id = None
-            if "panoId" in tile and tile["panoId"] is not None and tile["panoId"]:
-                pano_id = tile["panoId"]
-            elif "extra" in tile and isinstance(tile["extra"], dict) and "panoId" in tile["extra"] and tile["extra"]["panoId"] is not None and tile["extra"]["panoId"]:
-                pano_id = tile["extra"]["panoId"]
+            pano_id = tile.get("panoId") or (tile.get("extra") or {}).get("panoId")
             
             if not pano_id:
-                print(f"Skipping tile without panoId in both main field and extra.panoId: {tile}")
+                logger.warning(f"Skipping tile without panoId in both main field and extra.panoId: {tile}")
                 continue
             
-            # Generate new format filenames
+            # Generate new format filenames once and cache them on the tile for the download helpers
             try:
-                base_filename = create_new_filename(tile)
+                base_filename = get_tile_filename(tile)
                 full_filename = base_filename
                 thumb_filename = base_filename.replace('.jpg', '~thumb.jpg')
             except Exception as e:
-                print(f"ERROR: Failed to create filename for tile {pano_id}: {e}")
+                logger.error(f"ERROR: Failed to create filename for tile {pano_id}: {e}")
                 continue
             
             # Check if full and thumb images exist
-            full_exists = (output_dir / full_filename).exists()
-            thumb_exists = (output_dir / thumb_filename).exists()
+            full_exists = full_filename in existing_files
+            thumb_exists = thumb_filename in existing_files
             
             if not full_exists and not thumb_exists:
                 # Neither exists - need to download both
@@ -401,26 +138,24 @@ async def process_json_file_async(json_file, browser_pool, api_key, http_port, s
             # If both exist, skip entirely
         
         if not needed_tiles and not thumb_only_tiles:
-            print(f"All images already exist for {json_file.name}")
+            logger.info(f"All images already exist for {json_file.name}")
             return []
         
         downloaded = []
         
         # Download images for needed tiles
         if needed_tiles:
-            print(f"Need to download {len(needed_tiles)} images from {json_file.name}")
-            for i, tile in enumerate(needed_tiles):
-                print(f"  [{i+1}/{len(needed_tiles)}] Processing tile...")
-                filenames = await download_pano_image(browser_pool, tile, api_key, output_dir, http_port, skip_direct_download)
-                if filenames:
-                    downloaded.extend(filenames)
+            logger.info(f"Need to download {len(needed_tiles)} images from {json_file.name}")
+            downloaded.extend(await download_tiles(
+                needed_tiles, browser_pool, api_key, LocalImageStore(output_dir), http_port, http_session, skip_direct_download
+            ))
         
         # Generate thumbs for tiles that only need thumb generation
         if thumb_only_tiles:
-            print(f"Generating {len(thumb_only_tiles)} thumbnails from existing full images...")
+            logger.info(f"Generating {len(thumb_only_tiles)} thumbnails from existing full images...")
             for i, tile in enumerate(thumb_only_tiles):
                 try:
-                    base_filename = create_new_filename(tile)
+                    base_filename = get_tile_filename(tile)
                     full_filename = base_filename
                     thumb_filename = base_filename.replace('.jpg', '~thumb.jpg')
                     
@@ -428,20 +163,19 @@ async def process_json_file_async(json_file, browser_pool, api_key, http_port, s
                     thumb_path = output_dir / thumb_filename
                     
                     # Load the existing full image and create thumbnail
-                    full_image = Image.open(full_path)
-                    thumb_image = full_image.resize((400, 300), Image.Resampling.LANCZOS)
-                    thumb_image.save(thumb_path, "JPEG", quality=85)
-                    print(f"  [{i+1}/{len(thumb_only_tiles)}] Generated: {thumb_filename}")
+                    with Image.open(full_path) as full_image:
+                        thumb_path.write_bytes(create_thumbnail(full_image))
+                    logger.info(f"  [{i+1}/{len(thumb_only_tiles)}] Generated: {thumb_filename}")
                     downloaded.append(thumb_filename)
                 except Exception as e:
-                    pano_id = tile.get('panoId') or tile.get('extra', {}).get('panoId', 'unknown')
-                    print(f"  [{i+1}/{len(thumb_only_tiles)}] Error generating thumb for {pano_id}: {e}")
+                    pano_id = tile.get('panoId') or (tile.get('extra') or {}).get('panoId', 'unknown')
+                    logger.error(f"  [{i+1}/{len(thumb_only_tiles)}] Error generating thumb for {pano_id}: {e}")
         
-        print(f"Processed {len(downloaded)} images from {json_file.name}")
+        logger.info(f"Processed {len(downloaded)} images from {json_file.name}")
         return downloaded
         
     except Exception as e:
-        print(f"Error processing {json_file.name}: {e}")
+        logger.error(f"Error processing {json_file.name}: {e}")
         return []
 
 
@@ -468,43 +202,32 @@ def prune_orphaned_images(delete_orphans=False):
     # Build set of expected filenames by walking through each tile
     expected_files = set()
     
-    for json_file in json_files:
+    for json_file, tiles in load_all_puzzle_tiles(json_files):
+        if isinstance(tiles, Exception):
+            print(f"Error reading {json_file}: {tiles}")
+            continue
+        
         try:
-            with open(json_file, 'r') as f:
-                data = json.load(f)
-            
-            # Extract tiles from the JSON structure
-            tiles = []
-            if isinstance(data, list):
-                tiles = data
-            elif isinstance(data, dict) and "customCoordinates" in data:
-                tiles = data["customCoordinates"]
-            elif isinstance(data, dict) and "tiles" in data:
-                tiles = data["tiles"]
-            elif isinstance(data, dict) and "data" in data:
-                tiles = data["data"]
-            
             # Generate expected filenames for each tile
             for tile in tiles:
-                pano_id = tile.get('panoId') or tile.get('extra', {}).get('panoId')
+                pano_id = tile.get('panoId') or (tile.get('extra') or {}).get('panoId')
                 if not pano_id:
                     continue
                 
                 try:
                     # Generate expected filename using new format
-                    expected_filename = create_new_filename(tile)
+                    expected_filename = get_tile_filename(tile)
                     expected_files.add(expected_filename)  # Full image
                     expected_files.add(expected_filename.replace('.jpg', '~thumb.jpg'))  # Thumbnail
                 except Exception as e:
                     print(f"Warning: Could not generate filename for {pano_id}: {e}")
-        
         except Exception as e:
             print(f"Error reading {json_file}: {e}")
     
     print(f"Found {len(expected_files)} expected files")
     
     # Find all JPG files in the img directory
-    actual_files = set(f.name for f in img_dir.glob("*.jpg"))
+    actual_files = list_existing_files(img_dir, ".jpg")
     print(f"Found {len(actual_files)} actual JPG files")
     
     # Find orphaned files (files that exist but aren't expected)
@@ -577,46 +300,35 @@ def dry_run():
     expected_files = set()
     total_tiles = 0
     
-    for json_file in json_files:
+    for json_file, tiles in load_all_puzzle_tiles(json_files):
+        if isinstance(tiles, Exception):
+            print(f"Error reading {json_file}: {tiles}")
+            continue
+        
         try:
-            with open(json_file, 'r') as f:
-                data = json.load(f)
-            
-            # Extract tiles from the JSON structure
-            tiles = []
-            if isinstance(data, list):
-                tiles = data
-            elif isinstance(data, dict) and "customCoordinates" in data:
-                tiles = data["customCoordinates"]
-            elif isinstance(data, dict) and "tiles" in data:
-                tiles = data["tiles"]
-            elif isinstance(data, dict) and "data" in data:
-                tiles = data["data"]
-            
             print(f"{json_file.name}: {len(tiles)} tiles")
             
             # Generate expected filenames for each tile
             for tile in tiles:
                 total_tiles += 1
-                pano_id = tile.get('panoId') or tile.get('extra', {}).get('panoId')
+                pano_id = tile.get('panoId') or (tile.get('extra') or {}).get('panoId')
                 if not pano_id:
                     continue
                 
                 try:
                     # Generate expected filename using new format
-                    expected_filename = create_new_filename(tile)
+                    expected_filename = get_tile_filename(tile)
                     expected_files.add(expected_filename)  # Full image
                     expected_files.add(expected_filename.replace('.jpg', '~thumb.jpg'))  # Thumbnail
                 except Exception as e:
                     print(f"Warning: Could not generate filename for {pano_id}: {e}")
-        
         except Exception as e:
             print(f"Error reading {json_file}: {e}")
     
     print(f"Found {len(expected_files)} expected files from {total_tiles} tiles")
     
     # Find all JPG files in the img directory
-    actual_files = set(f.name for f in img_dir.glob("*.jpg"))
+    actual_files = list_existing_files(img_dir, ".jpg")
     print(f"Found {len(actual_files)} actual JPG files")
     
     # Find missing files (expected but don't exist)
@@ -647,92 +359,6 @@ def dry_run():
             print(f"  ... and {len(orphaned_files) - 10} more")
 
 
-async def process_single_pano(pano_id, api_key=None, skip_direct_download=False):
-    """Process a single pano ID for testing."""
-    print(f"Processing single pano: {pano_id}")
-    
-    # Look up the actual tile data from JSON files
-    script_dir = Path(__file__).parent
-    parent_dir = script_dir.parent
-    puzzles_dir = parent_dir / "ui" / "public" / "puzzles"
-    json_files = list(puzzles_dir.glob("*.json"))
-    
-    tile = None
-    for json_file in json_files:
-        try:
-            with open(json_file, 'r') as f:
-                data = json.load(f)
-            
-            # Extract tiles from the JSON structure
-            tiles = []
-            if isinstance(data, list):
-                tiles = data
-            elif isinstance(data, dict) and "customCoordinates" in data:
-                tiles = data["customCoordinates"]
-            elif isinstance(data, dict) and "tiles" in data:
-                tiles = data["tiles"]
-            elif isinstance(data, dict) and "data" in data:
-                tiles = data["data"]
-            
-            # Look for the pano ID
-            for t in tiles:
-                if (t.get('panoId') == pano_id or 
-                    t.get('extra', {}).get('panoId') == pano_id):
-                    tile = t
-                    break
-            
-            if tile:
-                break
-        except Exception as e:
-            print(f"Error reading {json_file}: {e}")
-    
-    if not tile:
-        print(f"ERROR: Pano ID {pano_id} not found in any JSON files")
-        return
-    
-    print(f"Found tile data: {tile}")
-    
-    # Create output directory
-    output_dir = Path(__file__).parent / "img"
-    output_dir.mkdir(exist_ok=True)
-    
-    # Try direct download first (unless disabled)
-    if not skip_direct_download:
-        print("Trying direct download first...")
-        direct_result = await download_pano_image_direct(tile, output_dir)
-        if direct_result:
-            print(f"Successfully downloaded via direct method: {direct_result}")
-            return
-    else:
-        print("Skipping direct download, using browser method...")
-    
-    # If direct download fails and we have an API key, try browser method
-    if api_key:
-        print("Direct download failed, trying browser method...")
-        
-        # Find a free port and start HTTP server
-        port = find_free_port()
-        server, server_thread = start_http_server(port)
-        print(f"Started HTTP server on port {port}")
-        
-        # Initialize browser pool
-        browser_pool = BrowserPool(1)
-        await browser_pool.initialize()
-        
-        try:
-            # Download the image using browser method
-            filename = await download_pano_image(browser_pool, tile, api_key, output_dir, port, skip_direct_download)
-            if filename:
-                print(f"Successfully downloaded via browser method: {filename}")
-            else:
-                print("Failed to download image with both methods")
-        finally:
-            await browser_pool.close_all()
-            server.shutdown()
-    else:
-        print("Direct download failed and no API key provided for fallback")
-
-
 async def main_async():
     """Main async function to process all JSON files."""
     print("Geonections Image Downloader (Direct download + download.html fallback)")
@@ -778,7 +404,9 @@ async def main_async():
             if not fallback_api_key:
                 print("No API key provided. Exiting.")
                 return
-        await process_single_pano(pano_id, fallback_api_key, single_skip_direct)
+        output_dir = Path(__file__).parent / "img"
+        output_dir.mkdir(exist_ok=True)
+        await process_single_pano(pano_id, LocalImageStore(output_dir), fallback_api_key, single_skip_direct)
         return
     
     # Check for --no-direct flag
@@ -803,16 +431,7 @@ async def main_async():
     server, server_thread = start_http_server(port)
     print(f"Started HTTP server on port {port}")
     
-    # Test the HTTP server
-    import requests
-    try:
-        response = requests.get(f"http://localhost:{port}/pano/download.html", timeout=5)
-        if response.status_code == 200:
-            print("✓ HTTP server is responding correctly")
-        else:
-            print(f"⚠ HTTP server returned status {response.status_code}")
-    except Exception as e:
-        print(f"⚠ HTTP server test failed: {e}")
+    await check_http_server(port)
     
     # Get the parent directory (where JSON files are)
     script_dir = Path(__file__).parent
@@ -829,12 +448,13 @@ async def main_async():
         return
     
     print(f"Found {len(json_files)} puzzle JSON files to process")
-    print(f"Using {MAX_CONCURRENT_BROWSERS} concurrent browser instances")
+    print(f"Using {MAX_CONCURRENT_CONTEXTS} concurrent browser contexts")
     print()
     
-    # Initialize browser pool
-    browser_pool = BrowserPool(MAX_CONCURRENT_BROWSERS)
+    # Initialize browser pool and the shared HTTP session for direct downloads
+    browser_pool = BrowserPool(MAX_CONCURRENT_CONTEXTS)
     await browser_pool.initialize()
+    http_session = create_http_session()
     
     try:
         all_downloaded = []
@@ -843,7 +463,7 @@ async def main_async():
         # Process JSON files sequentially to avoid resource exhaustion
         for json_file in sorted(json_files):
             try:
-                result = await process_json_file_async(json_file, browser_pool, api_key, port, skip_direct_download)
+                result = await process_json_file_async(json_file, browser_pool, api_key, port, http_session, skip_direct_download)
                 all_downloaded.extend(result)
             except Exception as e:
                 print(f"Error processing {json_file.name}: {e}")
@@ -851,7 +471,7 @@ async def main_async():
         total_duration = time.time() - start_time
         
         # Count existing images (new format only)
-        existing_images = [f for f in os.listdir(script_dir) if f.endswith('.jpg') and '~d' in f and '~h' in f and '~p' in f and '~z' in f]
+        existing_images = [f for f in list_existing_files(img_dir, ".jpg") if _NEW_FMT.search(f)]
         
         print("=" * 50)
         print(f"Download complete!")
@@ -860,13 +480,20 @@ async def main_async():
         print(f"Total time: {total_duration:.1f}s")
         
     finally:
-        # Clean up browser pool and server
+        # Clean up HTTP session, browser pool and server
+        await http_session.close()
         await browser_pool.close_all()
         server.shutdown()
 
 
 def main():
     """Main function wrapper for async execution."""
+    # Per-tile progress goes through logging; set LOGLEVEL=DEBUG to see every download attempt
+    logging.basicConfig(
+        level=os.getenv("LOGLEVEL", "INFO").upper(),
+        handlers=[logging.StreamHandler(sys.stdout)],
+        format="%(message)s",
+    )
     asyncio.run(main_async())
 
 